@@ -0,0 +1,45 @@
+import numpy as np
+
+def lttb_downsample(y: np.ndarray, n_out: int) -> tuple:
+    """Downsample a time series to `n_out` points with Largest-Triangle-Three-Buckets (LTTB).
+    The first and last sample are kept, the rest is split into `n_out - 2` buckets and from each bucket
+    the sample spanning the largest triangle with its neighbouring buckets is selected.
+
+    Unlike the original algorithm, the first triangle corner is the average of the previous bucket
+    instead of the previously selected sample. This keeps the visual shape, but allows computing all
+    buckets at once with NumPy instead of looping over them in Python.
+
+    Returns the indices of the selected samples and their values."""
+    y = np.asarray(y)
+    n = len(y)
+    if n_out < 3 or n <= n_out:
+        return np.arange(n), y
+
+    # Bucket boundaries for the inner samples (without first and last), every bucket holds at least one sample
+    inner = y[1:n - 1]
+    bounds = np.linspace(0, n - 2, n_out - 1).astype(np.int64)
+    starts = bounds[:-1]
+    counts = np.diff(bounds)
+    x = np.arange(1, n - 1, dtype=np.float64)
+
+    avg_x = np.add.reduceat(x, starts) / counts
+    avg_y = np.add.reduceat(inner, starts, dtype=np.float64) / counts
+
+    # Left corner: average of the previous bucket, right corner: average of the next bucket
+    a_x = np.repeat(np.concatenate(([0.0], avg_x[:-1])), counts)
+    a_y = np.repeat(np.concatenate(([y[0]], avg_y[:-1])), counts)
+    c_x = np.repeat(np.concatenate((avg_x[1:], [n - 1.0])), counts)
+    c_y = np.repeat(np.concatenate((avg_y[1:], [y[-1]])), counts)
+
+    # Twice the triangle area, the factor doesn't matter for finding the maximum
+    area = np.abs((a_x - c_x) * (inner - a_y) - (a_x - x) * (c_y - a_y))
+
+    # Pick the first sample with the largest area in every bucket
+    bucket_ids = np.repeat(np.arange(len(starts)), counts)
+    is_max = area == np.maximum.reduceat(area, starts)[bucket_ids]
+    candidates = np.flatnonzero(is_max)
+    _, first = np.unique(bucket_ids[candidates], return_index=True)
+    selected = candidates[first] + 1
+
+    indices = np.concatenate(([0], selected, [n - 1]))
+    return indices, y[indices]
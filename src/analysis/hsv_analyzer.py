@@ -1,12 +1,30 @@
-from collections import deque
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 import datetime, time
+import math
 import logging
+from threading import Event
 import numpy as np
 from .profile_manager import ThresholdProfile
+from .ring_buffer import RingBuffer
 
 from camera.processor import ImageProcessor
 
+SAMPLES_PER_SECOND = 10
+"""Rate at which the analysis loop feeds new frames"""
+MAX_HISTORY_SAMPLES = 1800 * SAMPLES_PER_SECOND
+"""Maximum number of samples returned from the history, matches the largest history window of the UI"""
+HISTORY_CAPACITY = MAX_HISTORY_SAMPLES + 10 * SAMPLES_PER_SECOND
+"""Size of the history ring buffer. The headroom keeps the writer away from slots that are still being read."""
+HISTORY_CHANNELS = ('h_means', 's_means', 'v_means', 'h_decay', 's_decay', 'v_decay')
+"""Column order of the history array. The derivatives aren't stored, `get_history` derives them from the decay channels."""
+DERIVED_CHANNELS = {'h_decay': ('dH', 'ddH'), 's_decay': ('dS', 'ddS'), 'v_decay': ('dV', 'ddV')}
+"""Maps each decay channel to the names of its first and second derivative"""
+HISTORY_COLUMNS = {name: i for i, name in enumerate(HISTORY_CHANNELS)}
+HISTORY_DERIVATIVE_SAMPLES = 2
+"""Number of samples before the requested window that `get_history` reads to compute the first and second derivatives"""
+HISTORY_DTYPE = np.dtype([('timestamp', np.float64), ('values', np.float32, (len(HISTORY_CHANNELS),))])
+"""One history record. float32 only resolves epoch seconds to about two minutes, so the timestamp is stored as float64."""
+
 @dataclass
 class HSVStats:
     h_m: float = 0.0 # Raw values
@@ -28,8 +46,13 @@ class HSVAnalyzer:
         
         self.logger = logging.getLogger(__name__)
         
-        self.hsv_history = []
-        self.timestamps = []
+        # One record per sample with its timestamp and all channels, so both always share the same length.
+        # Reads return views instead of copies.
+        self.history = RingBuffer(HISTORY_CAPACITY, dtype=HISTORY_DTYPE)
+        self.last_stats: HSVStats = None
+
+        self.revision = 0
+        """Increases whenever the history (or how it is post-processed) changes, so consumers can skip redundant redraws"""
 
         self.ref_stats = None
         """Reference values for the first frame"""
@@ -49,6 +72,8 @@ class HSVAnalyzer:
         self.current_ellipse = None
         self.inner_ellipse = None
         self.ellipse_score = None
+        self.score_text: str = None
+        """Preformatted label of the ellipse score for the live preview, None if the score is not a finite number"""
         self.is_ellipse_enabled = True
         self.is_mask_frozen = False
         self.decay_alpha = 0.8
@@ -59,6 +84,11 @@ class HSVAnalyzer:
 
         self.current_profile: ThresholdProfile = None
         self.is_threshold_exceeded = False
+        self.alert_event = Event()
+        """Set when the thresholds become exceeded. It stays set when they drop below again, so short crossings aren't lost
+        between polls. Use `alert_count` to tell the crossings apart."""
+        self.alert_count = 0
+        """Number of times the thresholds became exceeded, lets every UI session alert once per crossing"""
 
         self.last_threshold_check = time.time()
         
@@ -70,11 +100,13 @@ class HSVAnalyzer:
         """Enable/disable derivative smoothing and set window size"""
         self.derivative_smoothing = enable
         self.smoothing_window_size = window_size
+        self.revision += 1
         self.logger.debug(f"Derivative smoothing {'enabled' if enable else 'disabled'} with window size {window_size}")
 
     def set_profile(self, profile: ThresholdProfile):
         """Set active threshold profile"""
         self.current_profile = profile
+        self.revision += 1
         self.logger.info(f"Set threshold profile: {profile.name}")
 
     def check_thresholds(self, stats: HSVStats) -> bool:
@@ -121,7 +153,7 @@ class HSVAnalyzer:
         if self.is_ellipse_enabled:
             # Find ellipse and create mask only if  we didn't freeze the existing one
             if not self.is_mask_frozen:
-                self.current_mask, self.current_ellipse, self.inner_ellipse, self.ellipse_score = self.processor.mask_ellipse_contour(frame)
+                self._set_ellipse_fit(*self.processor.mask_ellipse_contour(frame))
         else:
             self.current_mask = None
             self.current_ellipse = None
@@ -134,10 +166,23 @@ class HSVAnalyzer:
             self.logger.info(f"Found reference ellipse at x = {int(self.current_ellipse[0][0])}, y = {int(self.current_ellipse[0][1])}" +
             f" with size w = {int(self.current_ellipse[1][0])}, h = {int(self.current_ellipse[1][1])}")
         
+    def _set_ellipse_fit(self, mask, ellipse, inner_ellipse, score):
+        """Store the result of the ellipse fitting and format the score label once for all preview frames"""
+        if isinstance(score, (int, float)) and math.isfinite(score):
+            score_text = f"Ellipse Score: {score:.2f}"
+        else:
+            if score is not None and self.score_text is not None:
+                self.logger.info(f"Found illegal score: {score}")
+            score_text = None
+        self.current_mask, self.current_ellipse, self.inner_ellipse, self.ellipse_score = mask, ellipse, inner_ellipse, score
+        self.score_text = score_text
+
     def clear_history(self):
         """Clear all historical data"""
         
-        self.hsv_history.clear()
+        self.history.clear()
+        self.last_stats = None
+        self.revision += 1
         
     def set_use_reference_frame(self, use_reference: bool):
         """Set whether to use reference frame mode or previous frame mean mode"""
@@ -166,7 +211,7 @@ class HSVAnalyzer:
         
         if self.is_ellipse_enabled and not self.is_mask_frozen:
             # Update mask
-            self.current_mask, self.current_ellipse, self.inner_ellipse, self.ellipse_score = self.processor.mask_ellipse_contour(frame)
+            self._set_ellipse_fit(*self.processor.mask_ellipse_contour(frame))
         
         # Calculate stats using the mask
         hsv_stats = self.processor.get_hsv_stats(hsv_frame, self.current_mask)
@@ -202,13 +247,13 @@ class HSVAnalyzer:
             v_diff = hsv_stats['v_m'] - ref_stats['v_m']
 
         # Calculate new decay values
-        h_decay = (1-self.decay_alpha) * h_diff + self.decay_alpha * (self.hsv_history[-1].h_decay if self.hsv_history else h_diff)
-        s_decay = (1-self.decay_alpha) * s_diff + self.decay_alpha * (self.hsv_history[-1].s_decay if self.hsv_history else s_diff)
-        v_decay = (1-self.decay_alpha) * v_diff + self.decay_alpha * (self.hsv_history[-1].v_decay if self.hsv_history else v_diff)
+        prev = self.last_stats
+        h_decay = (1-self.decay_alpha) * h_diff + self.decay_alpha * (prev.h_decay if prev else h_diff)
+        s_decay = (1-self.decay_alpha) * s_diff + self.decay_alpha * (prev.s_decay if prev else s_diff)
+        v_decay = (1-self.decay_alpha) * v_diff + self.decay_alpha * (prev.v_decay if prev else v_diff)
         
         # Calculate derivatives
-        if self.hsv_history:
-            prev = self.hsv_history[-1]
+        if prev:
             dh = h_decay - prev.h_decay
             ds = s_decay - prev.s_decay
             dv = v_decay - prev.v_decay
@@ -233,8 +278,7 @@ class HSVAnalyzer:
             ddv=ddv
         )
         
-        self.hsv_history.append(relative_stats)
-        self.timestamps.append(datetime.datetime.now().strftime('%H:%M:%S.%f'))
+        self._append_history(relative_stats)
         
         # Update previous frame mean for next iteration (only in previous frame mean mode)
         if not self.use_reference_frame:
@@ -244,6 +288,52 @@ class HSVAnalyzer:
                 'v_m': hsv_stats['v_m']
             }
     
+    def _append_history(self, stats: HSVStats):
+        """Append a sample with its timestamp to the ring buffer"""
+        self.history.append((time.time(), (stats.h_m, stats.s_m, stats.v_m, stats.h_decay, stats.s_decay, stats.v_decay)))
+        self.last_stats = stats
+        self.revision += 1
+        self._update_threshold_alert()
+
+    def _update_threshold_alert(self):
+        """Check the thresholds against the newest sample, as it appears in the plot. This runs once per sample,
+        independent of how often the UI reads the history. With derivative smoothing only the tail of the history that
+        the smoothing windows reach into is read, so the result doesn't depend on the displayed history window."""
+        tail = 4 * self.smoothing_window_size + 8 if self.derivative_smoothing else 1
+        history = self.get_history(tail)
+        if len(history['h_decay']) == 0:
+            return
+        self.current_smoothed_stats = HSVStats(
+            h_m=history['h_means'][-1],
+            s_m=history['s_means'][-1],
+            v_m=history['v_means'][-1],
+            h_decay=history['h_decay'][-1],
+            s_decay=history['s_decay'][-1],
+            v_decay=history['v_decay'][-1],
+            dh=history['dH'][-1],
+            ds=history['dS'][-1],
+            dv=history['dV'][-1],
+            ddh=history['ddH'][-1],
+            dds=history['ddS'][-1],
+            ddv=history['ddV'][-1]
+        )
+
+        is_exceeded = self.check_thresholds(self.current_smoothed_stats)
+        if is_exceeded and not self.is_threshold_exceeded:
+            self.alert_count += 1
+            self.alert_event.set()
+        self.is_threshold_exceeded = is_exceeded
+
+    def get_history_snapshot(self) -> int:
+        """Return the head of the history, pass it to `get_history` and `history_changed_since` to refer to the same samples"""
+        return self.history.snapshot()
+
+    def history_changed_since(self, head: int, num_samples: int = MAX_HISTORY_SAMPLES) -> bool:
+        """Check if any of the latest `num_samples` before `head` were overwritten since `head` was taken.
+        The history is read without a lock, so readers call this once they are done with the arrays of `get_history`.
+        This also covers the older samples that `get_history` reads for the derivatives."""
+        return self.history.overwritten_since(head, num_samples + HISTORY_DERIVATIVE_SAMPLES)
+    
     def toggle_pause(self, state: bool = None):
         """Toggles between paused and resumed states.
         Args:
@@ -271,7 +361,7 @@ class HSVAnalyzer:
             return data
         
         # Convert to numpy array
-        data_array = np.array(data)
+        data_array = np.asarray(data)
         
         # Create uniform filter kernel
         kernel = np.ones(window_size) / window_size
@@ -280,27 +370,32 @@ class HSVAnalyzer:
         padded_data = np.pad(data_array, window_size//2, mode='edge')
         smoothed = np.convolve(padded_data, kernel, mode='valid')
     
-        return smoothed.tolist()
+        # Even window sizes yield one extra sample, trim so all channels keep the same length
+        return smoothed[:len(data_array)]
     
-    def get_history(self):
-        """Return history with derivative smoothing pipeline applied in post-processing"""
-        history = {
-            'timestamps': list(self.timestamps),
-            'h_means': [stats.h_m for stats in self.hsv_history],
-            's_means': [stats.s_m for stats in self.hsv_history],
-            'v_means': [stats.v_m for stats in self.hsv_history],
-            'h_decay': [stats.h_decay for stats in self.hsv_history],
-            's_decay': [stats.s_decay for stats in self.hsv_history],
-            'v_decay': [stats.v_decay for stats in self.hsv_history],
-            'dH': [stats.dh for stats in self.hsv_history],
-            'dS': [stats.ds for stats in self.hsv_history],
-            'dV': [stats.dv for stats in self.hsv_history],
-            'ddH': [stats.ddh for stats in self.hsv_history],
-            'ddS': [stats.dds for stats in self.hsv_history],
-            'ddV': [stats.ddv for stats in self.hsv_history]
-        }
+    def get_history(self, num_samples: int = MAX_HISTORY_SAMPLES, head: int = None):
+        """Return the latest `num_samples` of the history with derivative smoothing pipeline applied in post-processing.
+        This only reads the history, the thresholds are checked by the analyzer on every new sample.
+        Timestamps are returned as seconds since the epoch.
+        The channels are views into the ring buffer, readers that hold on to them can pass the `head` of a
+        `get_history_snapshot` and check `history_changed_since(head, num_samples)` when they are done."""
+        if head is None:
+            head = self.history.snapshot()
+        available = self.history.available(head)
+        num_samples = min(num_samples, available, MAX_HISTORY_SAMPLES)
+        # Read a few samples more, so the derivatives at the start of the window have their predecessors
+        extra = min(HISTORY_DERIVATIVE_SAMPLES, available - num_samples)
+        records = self.history.view_last(num_samples + extra, head)
+        block = records['values']
+        history = {name: block[extra:, col] for name, col in HISTORY_COLUMNS.items()}
+        history['timestamps'] = records['timestamp'][extra:]
+        for decay_name, (d_name, dd_name) in DERIVED_CHANNELS.items():
+            decay = block[:, HISTORY_COLUMNS[decay_name]].astype(np.float64)
+            d = np.diff(decay, prepend=decay[:1])
+            history[d_name] = d[extra:]
+            history[dd_name] = np.diff(d, prepend=d[:1])[extra:]
         
-        if self.derivative_smoothing and len(self.hsv_history) > 0:
+        if self.derivative_smoothing and len(history['h_decay']) > 0:
             # Convert to numpy arrays for efficient processing
             h_decay_array = np.array(history['h_decay'])
             s_decay_array = np.array(history['s_decay'])
@@ -363,27 +458,6 @@ class HSVAnalyzer:
             history['ddS'] = final_ddS
             history['ddV'] = final_ddV
 
-        # Update current smoothed stats with the last entry
-        if self.hsv_history:
-            # Create HSVStats object from the last smoothed values
-            self.current_smoothed_stats = HSVStats(
-                h_m=history['h_means'][-1] if len(history['h_means']) > 0 else 0.0,
-                s_m=history['s_means'][-1] if len(history['s_means']) > 0 else 0.0,
-                v_m=history['v_means'][-1] if len(history['v_means']) > 0 else 0.0,
-                h_decay=history['h_decay'][-1] if len(history['h_decay']) > 0 else 0.0,
-                s_decay=history['s_decay'][-1] if len(history['s_decay']) > 0 else 0.0,
-                v_decay=history['v_decay'][-1] if len(history['v_decay']) > 0 else 0.0,
-                dh=history['dH'][-1] if len(history['dH']) > 0 else 0.0,
-                ds=history['dS'][-1] if len(history['dS']) > 0 else 0.0,
-                dv=history['dV'][-1] if len(history['dV']) > 0 else 0.0,
-                ddh=history['ddH'][-1] if len(history['ddH']) > 0 else 0.0,
-                dds=history['ddS'][-1] if len(history['ddS']) > 0 else 0.0,
-                ddv=history['ddV'][-1] if len(history['ddV']) > 0 else 0.0
-            )
-            
-            # Check thresholds using the smoothed values
-            self.is_threshold_exceeded = self.check_thresholds(self.current_smoothed_stats)
-        
         return history
     
     def log_timestamp(self):
@@ -405,12 +479,12 @@ class HSVAnalyzer:
             # Fallback to original logging if current_smoothed_stats doesn't exist
             self.logger.info(
                 f"time: {current_time}, "
-                f", H (smooth): {self.hsv_history[-1].h_decay if self.hsv_history else 0.0}, "
-                f"S (smooth): {self.hsv_history[-1].s_decay if self.hsv_history else 0.0}, "
-                f"V (smooth): {self.hsv_history[-1].v_decay if self.hsv_history else 0.0}, "
-                f"dH: {self.hsv_history[-1].dh if self.hsv_history else 0.0}, "
-                f"dS: {self.hsv_history[-1].ds if self.hsv_history else 0.0}, "
-                f"dV: {self.hsv_history[-1].dv if self.hsv_history else 0.0}, "
-                f"ddH: {self.hsv_history[-1].ddh if self.hsv_history else 0.0}, "
-                f"ddS: {self.hsv_history[-1].dds if self.hsv_history else 0.0}, "
-                f"ddV: {self.hsv_history[-1].ddv if self.hsv_history else 0.0}")
+                f", H (smooth): {self.last_stats.h_decay if self.last_stats else 0.0}, "
+                f"S (smooth): {self.last_stats.s_decay if self.last_stats else 0.0}, "
+                f"V (smooth): {self.last_stats.v_decay if self.last_stats else 0.0}, "
+                f"dH: {self.last_stats.dh if self.last_stats else 0.0}, "
+                f"dS: {self.last_stats.ds if self.last_stats else 0.0}, "
+                f"dV: {self.last_stats.dv if self.last_stats else 0.0}, "
+                f"ddH: {self.last_stats.ddh if self.last_stats else 0.0}, "
+                f"ddS: {self.last_stats.dds if self.last_stats else 0.0}, "
+                f"ddV: {self.last_stats.ddv if self.last_stats else 0.0}")
@@ -0,0 +1,56 @@
+from threading import Lock
+import numpy as np
+
+class RingBuffer:
+    """Fixed-capacity ring buffer of samples backed by a single preallocated NumPy array.
+    A sample can be a scalar, a row of values or a structured record, so a time range of all channels is one contiguous slice.
+
+    Appends and clears are serialized with a lock, readers don't take it: the writer fills a slot before it publishes
+    the new length, and readers check with `overwritten_since` whether the writer lapped them while they were reading (like a seqlock)."""
+
+    def __init__(self, capacity: int, width: int = None, dtype=np.float32):
+        self.capacity = capacity
+        self.buffer = np.empty((capacity,) if width is None else (capacity, width), dtype=dtype)
+        self.length = 0
+        """Number of samples written since the buffer was created, it never decreases"""
+        self.start = 0
+        """Length at the last clear, older samples are not part of the buffer anymore"""
+        self._write_lock = Lock()
+
+    def append(self, sample):
+        """Write a sample into the next slot, then publish the new length"""
+        with self._write_lock:
+            self.buffer[self.length % self.capacity] = sample
+            self.length += 1
+
+    def clear(self):
+        """Drop all samples. The slots are left untouched, so readers of older samples aren't affected."""
+        with self._write_lock:
+            self.start = self.length
+
+    def snapshot(self) -> int:
+        """Return the current length, all slots before it are completely written"""
+        return self.length
+
+    def available(self, head: int) -> int:
+        """Number of samples before `head` that were written since the last clear"""
+        return max(0, min(head - self.start, self.capacity))
+
+    def overwritten_since(self, head: int, num_samples: int) -> bool:
+        """Check if the writer reused any slot of the `num_samples` before `head` since `head` was taken.
+        Readers call this after they are done with a view, and read again if it returns True.
+        The slot of index `length` may be half written, it holds the sample `length - capacity` until then."""
+        return self.length - head >= self.capacity - num_samples
+
+    def view_last(self, num_samples: int, head: int = None) -> np.ndarray:
+        """Return the latest `num_samples` before `head` (defaults to the current length) in chronological order.
+        This is a view into the buffer unless the range wraps around its end."""
+        if head is None:
+            head = self.snapshot()
+        num_samples = min(num_samples, self.available(head))
+        if num_samples <= 0:
+            return self.buffer[:0]
+        end = (head - 1) % self.capacity + 1
+        if end >= num_samples:
+            return self.buffer[end - num_samples:end]
+        return np.concatenate((self.buffer[self.capacity - (num_samples - end):], self.buffer[:end]))
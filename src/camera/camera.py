@@ -1,7 +1,6 @@
 
 # TODO This is only needed if using a logitech webcam
 import os
-import subprocess
 os.environ["OPENCV_VIDEOIO_MSMF_ENABLE_HW_TRANSFORMS"] = "0"
 
 import numpy as np
@@ -9,11 +8,9 @@ import cv2
 from threading import Thread, Lock
 import time
 import logging
-import warnings
 import ids_peak.ids_peak as ids_peak
 import ids_peak_ipl.ids_peak_ipl as ids_ipl
 import ids_peak.ids_peak_ipl_extension as ids_ipl_extension
-from timeit import default_timer as timer
 
 class Camera:
     def __init__(self, device_index=0):
@@ -23,7 +20,9 @@ class Camera:
         self.frame = None
         self.raw_frame = None # Needed for calculating the white balance
         self.frame_ready = False
+        self.frame_counter = 0 # Increases with every new frame, lets consumers detect stale frames
         self._stopped = False
+        self._capture_thread: Thread = None
         self.device_path = f"/dev/video{device_index}"
         self.use_ids = False
         self.sensor_width = None
@@ -67,9 +66,9 @@ class Camera:
 
     def build_gamma_LUT(self, gamma: float = 1.0):
         """(Re)constructs a lookup table for nonlinear gamma conversion of a frame."""
-        self.lut = np.empty((1,256), np.uint8)
-        for i in range(256):
-            self.lut[0,i] = np.clip(pow(i / 255.0, gamma) * 255.0, 0, 255)
+        # Computed for all 256 values at once and swapped in as a whole, so the capture loop never sees a half-built table
+        lut = np.clip(np.power(np.arange(256) / 255.0, gamma) * 255.0, 0, 255)
+        self.lut = lut.astype(np.uint8).reshape(1, 256)
 
     def calculate_WB(self, frame = None) -> tuple:
         """Takes in a frame and returns the red and blue gains for a grey world."""
@@ -132,7 +131,8 @@ class Camera:
         self.build_gamma_LUT(1.0)
         if self.use_ids:
             self.logger.info("Using IDS camera")
-            Thread(target=self._capture_loop, daemon=True).start()
+            self._capture_thread = Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
             self.logger.info("Started camera thread")
             return
         else:
@@ -140,7 +140,11 @@ class Camera:
             self.stream = cv2.VideoCapture(actual_index)
             if not self.stream.isOpened():
                 raise RuntimeError(f"Failed to open camera at index {actual_index}")        
-            Thread(target=self._capture_loop, daemon=True).start()
+            # Only keep the newest frame in the driver queue, otherwise the preview lags a few frames behind.
+            # Not every backend supports this, in which case the property is silently ignored.
+            self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self._capture_thread = Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
             self.logger.info(f"Started camera thread for device {actual_index}")
 
     def _get_actual_webcam_index(self):
@@ -253,9 +257,12 @@ class Camera:
                 frame = cv2.LUT(frame, self.lut)
 
                 frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                # Published frames are shared without copying, so lock them against modification
+                frame_bgr.flags.writeable = False
 
                 with self.lock:
                     self.frame = frame_bgr
+                    self.frame_counter += 1
                     self.frame_ready = True
 
                 # Record frames to file if the flag is set
@@ -276,8 +283,11 @@ class Camera:
                         frame = None
                         
                 if ret:
+                    # Published frames are shared without copying, so lock them against modification
+                    frame.flags.writeable = False
                     with self.lock:
                         self.frame = frame
+                        self.frame_counter += 1
                         self.frame_ready = True
                         if self.is_stream_from_file:
                             self.current_frame_idx += 1
@@ -293,14 +303,27 @@ class Camera:
 
             time.sleep(0.03)  # ~30 FPS
             
-    def get_frame(self):
+    def get_frame(self, copy: bool = True):
+        """Returns the latest frame. With `copy=False` the shared, read-only frame is returned without copying."""
+        with self.lock:
+            if self.frame is None:
+                return None
+            return self.frame.copy() if copy else self.frame
+
+    def get_frame_view(self) -> tuple:
+        """Returns `(frame_counter, frame)` for the latest frame without copying.
+        Every new frame is a new read-only array, so the counter always belongs to the returned pixels."""
         with self.lock:
-            return self.frame.copy() if self.frame is not None else None
+            return self.frame_counter, self.frame
             
     def stop(self):
         self.logger.info(f"Stopped camera {self.device_index}")
         self._stopped = True
         self.frame_ready = False
+        # Let the capture loop finish its current frame before the stream is released underneath it
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=2.0)
+            self._capture_thread = None
         if self.use_ids:
             try:
                 self.ids_device_nodemap.FindNode("AcquisitionStop").Execute()
@@ -335,8 +358,9 @@ class Camera:
 
     def stop_recording(self):
         if hasattr(self, 'video_writer') and self.video_writer is not None:
-            self.video_writer.release()
+            # Clear the flag first, so the capture loop doesn't write to the released writer
             self.is_recording = False
+            self.video_writer.release()
             self.logger.info("Stopped recording.")
             
     def reset_video_reader(self):
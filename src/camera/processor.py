@@ -17,23 +17,12 @@ class ImageProcessor:
     @staticmethod
     def get_hsv_stats(hsv_frame, mask=None):
         """Calculate HSV statistics, optionally using a mask"""
-        h, s, v = cv2.split(hsv_frame)
-        
-        # If mask is provided, apply it to each channel
+        # cv2.mean averages all channels in a single pass, without splitting the frame or copying the masked pixels
         if mask is not None and mask.shape == hsv_frame.shape:
-            h = cv2.bitwise_and(h, h, mask=mask)
-            s = cv2.bitwise_and(s, s, mask=mask)
-            v = cv2.bitwise_and(v, v, mask=mask)
-            
             # Calculate means only for non-zero mask areas
-            h_mean = np.mean(h[mask > 0])
-            s_mean = np.mean(s[mask > 0])
-            v_mean = np.mean(v[mask > 0])
-           
+            h_mean, s_mean, v_mean, _ = cv2.mean(hsv_frame, mask=mask)
         else:
-            h_mean = np.mean(h)
-            s_mean = np.mean(s)
-            v_mean = np.mean(v)
+            h_mean, s_mean, v_mean, _ = cv2.mean(hsv_frame)
             
         return {
             'h_m': h_mean,
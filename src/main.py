@@ -9,19 +9,20 @@ from camera.camera import Camera
 from camera.processor import ImageProcessor
 from analysis.hsv_analyzer import HSVAnalyzer
 from web.server import WebServer
-import time
 import threading
 import logging
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def analysis_loop(camera, processor, analyzer):
-    while True:
-        frame = camera.get_frame()
-        if frame is not None:
-            analyzer.update(frame)
-        time.sleep(0.1)  # 10 Hz analysis rate
+def analysis_loop(camera, processor, analyzer, stop_event: threading.Event):
+    while not stop_event.is_set():
+        # Skip paused updates entirely. The analyzer only reads the frame, so it gets the shared read-only one without a copy.
+        if not analyzer.is_paused:
+            frame = camera.get_frame(copy=False)
+            if frame is not None:
+                analyzer.update(frame)
+        stop_event.wait(0.1)  # 10 Hz analysis rate
 
 def main():
 
@@ -40,7 +41,7 @@ def main():
     logger.info("Initialized camera, processor, analyser and server.")
     
     # Start analysis loop in a separate thread
-    analyzer_thread = threading.Thread(target=analysis_loop, args=(camera, processor, analyzer))
+    analyzer_thread = threading.Thread(target=analysis_loop, args=(camera, processor, analyzer, server.stop_event))
     analyzer_thread.daemon = True
     analyzer_thread.start()
     logger.info("Started the analyzer thread.")
@@ -48,8 +49,13 @@ def main():
     # Start web server
     server.launch()
     
-    # Once we are here, we can assume the server was stopped, so we also stop the camera
+    # Once we are here, we can assume the server was stopped, so we also stop the workers and the camera
+    server.stop_event.set()
+    analyzer_thread.join(timeout=1.0)
     camera.stop()
+    logger.info("Shut down.")
+    # A file dialog that is still open would keep the process alive, so don't wait for the remaining threads
+    os._exit(0)
 
 if __name__ == "__main__":
     logger.info("Starting up...")
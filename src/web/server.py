@@ -1,71 +1,154 @@
-import os
+import random
+import base64
 import gradio as gr
-import plotly.graph_objects as go
-from threading import Lock
+import plotly.io as pio
+from gradio.components.plot import PlotData
+from gradio.processing_utils import save_bytes_to_cache
+from gradio.utils import get_upload_folder
 import logging
 import time
 from pathlib import Path
-from threading import Lock, Event, Thread
+import tempfile
+from threading import Lock, Event, Timer
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import pandas as pd
 from dataclasses import fields
-
-import tkinter as tk
-from tkinter import filedialog
-import csv
 from datetime import datetime
-
-from camera.camera import Camera
-from camera.processor import ImageProcessor
-from analysis.profile_manager import ProfileManager
-from analysis.hsv_analyzer import HSVAnalyzer
+from typing import TYPE_CHECKING
+
+from analysis.profile_manager import ProfileManager, ThresholdProfile
+from analysis.downsampling import lttb_downsample
+from analysis.hsv_analyzer import HSVAnalyzer, SAMPLES_PER_SECOND, MAX_HISTORY_SAMPLES
+
+if TYPE_CHECKING:
+    import tkinter as tk
+    from camera.camera import Camera
+
+CSV_COLUMNS = {
+    'h_means': 'H_Measured', 's_means': 'S_Measured', 'v_means': 'V_Measured',
+    'h_decay': 'H_Averaged', 's_decay': 'S_Averaged', 'v_decay': 'V_Averaged',
+    'dH': 'dH', 'dS': 'dS', 'dV': 'dV',
+    'ddH': 'ddH', 'ddS': 'ddS', 'ddV': 'ddV'
+}
+"""Maps the history channels to the column names of exported CSV files, after the timestamp"""
+
+# The profiles name the derivative thresholds in lower case (dh instead of dH)
+CHANNEL_SPEC = {
+    "H (raw)": ("h_means", "h_means", "#c8d6ae"),
+    "S (raw)": ("s_means", "s_means", "#b9cdeb"),
+    "V (raw)": ("v_means", "v_means", "#ebb9cd"),
+    "H (smooth)": ("h_decay", "h_decay", "#95d02f"),
+    "S (smooth)": ("s_decay", "s_decay", "#43a7e1"),
+    "V (smooth)": ("v_decay", "v_decay", "#e443a9"),
+    "dH": ("dH", "dh", "#729a27"),
+    "dS": ("dS", "ds", "#2f6e9d"),
+    "dV": ("dV", "dv", "#9c2f6c"),
+    "ddH": ("ddH", "ddh", "#445e17"),
+    "ddS": ("ddS", "dds", "#1a3f66"),
+    "ddV": ("ddV", "ddv", "#661a3f")
+}
+"""Maps the channel names in the dropdown to their history field, profile threshold name and plot color"""
+
+def format_time_of_day(timestamps: np.ndarray) -> np.ndarray:
+    """Format epoch seconds as local `HH:MM:SS.ffffff` strings, vectorized instead of one `strftime` per sample"""
+    utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+    iso = np.datetime_as_string(np.round((timestamps + utc_offset) * 1e6).astype('datetime64[us]'))
+    # Cut the date off the ISO strings 'YYYY-MM-DDTHH:MM:SS.ffffff' by viewing them as single characters
+    chars = iso.astype('U26').view('U1').reshape(len(iso), 26)[:, 11:]
+    return np.ascontiguousarray(chars).view('U15').ravel()
+
+
+def typed_array(values: np.ndarray, dtype: str) -> dict:
+    """Encode an array as a Plotly typed array spec (base64 encoded little-endian bytes).
+    This is a fraction of the size of a JSON list of numbers, and the browser doesn't need to parse every value."""
+    return dict(dtype=dtype, bdata=base64.b64encode(np.ascontiguousarray(values, dtype='<' + dtype)).decode('ascii'))
+
+
+class RefreshGate:
+    """Remembers what each browser session was sent last by a periodic callback.
+    Updates are only let through if their content changed and the minimum interval has passed.
+    The interval varies randomly by up to `jitter` (relative), so sessions don't all refresh in lockstep.
+    With `baseline_new_sessions`, the first call of a session only records its key, so it isn't sent what happened before it was opened."""
+    def __init__(self, min_interval: float = 0.05, jitter: float = 0.0, session_timeout: float = 300.0,
+                 baseline_new_sessions: bool = False):
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self.baseline_new_sessions = baseline_new_sessions
+        self.session_timeout = session_timeout
+        """Sessions that didn't call for this many seconds are forgotten, their tab was most likely closed"""
+        self._sessions: dict = {}
+        self._last_eviction = time.monotonic()
+
+    def should_update(self, request: gr.Request, key) -> bool:
+        session = request.session_hash if request is not None else None
+        now = time.monotonic()
+        if now - self._last_eviction > self.session_timeout:
+            self._evict_stale_sessions(now)
+        entry = self._sessions.get(session)
+        if entry is None and self.baseline_new_sessions:
+            self._sessions[session] = (key, now, now)
+            return False
+        last_key, last_time, _ = entry or (None, 0.0, now)
+        if key == last_key or now - last_time < self.min_interval * (1 + random.uniform(-self.jitter, self.jitter)):
+            self._sessions[session] = (last_key, last_time, now)
+            return False
+        self._sessions[session] = (key, now, now)
+        return True
+
+    def _evict_stale_sessions(self, now: float):
+        """Drop all sessions that weren't seen within the session timeout"""
+        self._last_eviction = now
+        for session, (_, _, last_seen) in list(self._sessions.items()):
+            if now - last_seen > self.session_timeout:
+                self._sessions.pop(session, None)
 
 class WebServer:
     def __init__(self, camera, analyzer):
-        self.camera: Camera = camera
+        self.camera: "Camera" = camera
         self.analyzer: HSVAnalyzer = analyzer
-        self.lock = Lock()
         self.update_event = Event()
-        self.should_stop = False
+        self.stop_event = Event()
+        """Set on shutdown, worker loops exit once it is set"""
         self.history_window = 60 # default is a minute
         self.logger = logging.getLogger(__name__)
         self.cameras: dict = None
         self.camera_names = None
         self.selected_channels = ["H (smooth)", "S (smooth)", "V (smooth)"]  # Default color channels for dropdown
         self.profile_manager = ProfileManager()
-        self.time_since_alert = time.time()
+        self.time_since_alert = time.monotonic()
         self.alert_timer: gr.Timer
+        # Skip plot/frame refreshes if nothing changed since the last one, and cap them at the rates set in the UI
+        self.plot_gate = RefreshGate(1.0, jitter=0.1)
+        self.frame_gate = RefreshGate(0.1, jitter=0.1)
+        self.alert_gate = RefreshGate(0, baseline_new_sessions=True)
+        self._fig: dict = None
+        """Plot skeleton with traces and threshold lines, only the trace data is replaced on refresh"""
+        self._plot_key = None
+        self._plot_data: PlotData = None
+        self._plot_template = pio.templates[pio.templates.default].to_plotly_json()
+        self.target_plot_points = 1500
+        """Number of points per trace sent to the browser for long series. Series with less than twice
+        as many samples are sent as they are, as downsampling them barely shrinks the payload."""
+        # Reused drawing buffer for show_frame, (re)allocated when the frame size changes
+        self._annot_buf: np.ndarray = None
+        self._last_render_key = None
+        self._last_frame_path: str = None
+        self.jpeg_quality = 80
+        """Quality of the JPEG images of the live preview"""
+        # All file dialogs share one hidden Tk root, which lives on its own thread
+        self._dialog_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-dialogs")
+        self._tk_root: "tk.Tk" = None
+        # Camera setting changes are collected and applied together once the inputs settle
+        self._pending_camera_settings: dict = {}
+        self._camera_settings_timer: Timer = None
+        self._camera_settings_lock = Lock()
         
-        self.col_map = {
-            "h_means": "#c8d6ae",
-            "s_means": "#b9cdeb",
-            "v_means": "#ebb9cd",
-            "h_decay": "#95d02f",
-            "s_decay": "#43a7e1",
-            "v_decay": "#e443a9",
-            "dH": "#729a27",
-            "dS": "#2f6e9d",
-            "dV": "#9c2f6c",
-            "ddH": "#445e17",
-            "ddS": "#1a3f66",
-            "ddV": "#661a3f"
-        }
-        # This maps the fancy names in the dropdown to the actual field names in the analyzer
-        self.channel_names = {
-            "H (raw)": "h_means",
-            "S (raw)": "s_means",
-            "V (raw)": "v_means",
-            "H (smooth)": "h_decay",
-            "S (smooth)": "s_decay",
-            "V (smooth)": "v_decay",
-            "dH": "dH",
-            "dS": "dS",
-            "dV": "dV",
-            "ddH": "ddH",
-            "ddS": "ddS",
-            "ddV": "ddV"
-        }
+        self._profile_thresholds: dict = {}
+        """Threshold values of the active profile by field name, unset thresholds are left out"""
+        self._selected_fields: list = []
+        self.set_selected_channels(self.selected_channels)
 
     def toggle_pause(self, state: bool = None):
         return self.analyzer.toggle_pause(state)
@@ -75,13 +158,38 @@ class WebServer:
     
     def set_new_reference(self):
     
-        frame = self.camera.get_frame()
+        # The analyzer only reads the frame, so the shared read-only frame is enough
+        frame = self.camera.get_frame(copy=False)
         if frame is not None:
             self.analyzer.set_reference(frame)
             
     def update_history_window(self, new_window):
         """Update the history window size (in seconds)"""
         self.history_window = int(new_window)
+        self._rebuild_plot_skeleton()
+
+    def set_refresh_rates(self, plot_rate: float, frame_rate: float):
+        """Set the maximum refresh rates (in Hz) of the plot and the video for all sessions.
+        They are still capped by the timers of the components (10 Hz plot, ~30 Hz video)."""
+        self.plot_gate.min_interval = 1 / plot_rate if plot_rate else 1.0
+        self.frame_gate.min_interval = 1 / frame_rate if frame_rate else 0.1
+
+    def set_selected_channels(self, selected: list):
+        """Set the channels to plot and precompute their field names, threshold names and colors"""
+        self.selected_channels = selected
+        self._selected_fields = [(choice, *CHANNEL_SPEC[choice]) for choice in selected]
+        self._rebuild_plot_skeleton()
+
+    def set_profile(self, profile: ThresholdProfile):
+        """Activate a threshold profile and cache its threshold values"""
+        self.analyzer.set_profile(profile)
+        self._profile_thresholds = {field.name: getattr(profile, field.name) for field in fields(profile)
+                                    if field.name != 'name' and getattr(profile, field.name) is not None}
+        self._rebuild_plot_skeleton()
+
+    def get_window_size(self) -> int:
+        """Number of samples that fit into the history window. A window of 0 shows the complete history."""
+        return int(self.history_window * SAMPLES_PER_SECOND) or MAX_HISTORY_SAMPLES
 
     def set_use_reference_frame(self, use_reference):
         self.analyzer.set_use_reference_frame(use_reference)
@@ -102,141 +210,183 @@ class WebServer:
         
         return None  # Return None to clear the current frame while switching
     
+    def update_camera_setting(self, name: str, value):
+        """Queue a change of an IDS camera setting. Queued changes are applied at most every 200 ms
+        with the latest values, so rapid edits don't hammer the camera but a held spinner still updates it."""
+        with self._camera_settings_lock:
+            self._pending_camera_settings[name] = value
+            if self._camera_settings_timer is None:
+                self._camera_settings_timer = Timer(0.2, self._apply_camera_settings)
+                self._camera_settings_timer.daemon = True
+                self._camera_settings_timer.start()
+
+    def _apply_camera_settings(self):
+        """Apply all queued camera settings"""
+        with self._camera_settings_lock:
+            settings, self._pending_camera_settings = self._pending_camera_settings, {}
+            self._camera_settings_timer = None
+        # Apply every setting on its own, so one rejected value doesn't drop the others
+        for name, value in settings.items():
+            try:
+                if name == 'gamma':
+                    self.camera.build_gamma_LUT(value)
+                else:
+                    setattr(self.camera, name, value)
+            except Exception:
+                self.logger.exception("Failed to set camera %s to %s", name, value)
+
     def find_camera_devices(self):
         # Get list of available cameras
         self.cameras = self.camera.list_cameras()
         self.camera_names = [cam["name"] for cam in self.cameras]
 
-    def check_alerts(self):
+    def check_alerts(self, request: gr.Request = None):
         """Check for threshold alerts and return appropriate UI feedback"""
-        if self.analyzer.is_threshold_exceeded:
-            
-            gr.Warning(f"Threshold exceeded for {self.analyzer.current_profile.name}!", duration=3)
-            if time.time() - self.time_since_alert > 3:
-                self.logger.info(f"Threshold exceeded for {self.analyzer.current_profile.name}!")
-                self.time_since_alert = time.time()
+        # Warn once per threshold crossing in every session, even if it already ended since the last tick.
+        # Newly opened sessions start from the current count instead of replaying old crossings.
+        if self.alert_gate.should_update(request, self.analyzer.alert_count):
+            profile_name = self.analyzer.current_profile.name
+            gr.Warning(f"Threshold exceeded for {profile_name}!", duration=3)
+            # Every open session gets the warning, but it is only logged once
+            now = time.monotonic()
+            if now - self.time_since_alert > 3:
+                self.logger.info("Threshold exceeded for %s!", profile_name)
+                self.time_since_alert = now
         return None  # Return None to avoid updating any component
     
         
-    def create_plots(self):
-        with self.lock:
-            history = self.analyzer.get_history()
-            
-        samples_per_second = 10
-        window_size = int(self.history_window * samples_per_second)
-        
-        def get_recent(data):
-            return data[-window_size:] if len(data) > window_size else data
-        
-        fig = go.Figure()
-
-        profile = self.analyzer.current_profile
-        if profile is not None:
-            field_names = [field.name for field in fields(profile) if field.name != 'name']
-
-        for choice in self.selected_channels:
-            fig.add_trace(go.Scatter(y=get_recent(history[self.channel_names[choice]]),
-                                        name=choice,
-                                        line=dict(color=self.col_map[self.channel_names[choice]])))
-            # Add horizontal lines for thresholds
-            if self.channel_names[choice] in field_names:
-                field_name = self.channel_names[choice]
-                threshold = getattr(profile, field_name)
-                fig.add_hline(y=threshold, line=dict(color=self.col_map[field_name], dash="dash"))
-        
-        
-
-        fig.update_layout(
-            title=f"Relative HSV Changes (Last {self.history_window} seconds)",
-            xaxis_title="Samples",
-            yaxis_title="Value",
-            legend=dict(yanchor="bottom", orientation="h", y=1)
-        )
+    def create_plots(self, request: gr.Request = None):
+        # The revision doesn't change while the analyzer is paused, so paused plots are skipped here as well
+        plot_key = (self.analyzer.revision, self.history_window, tuple(self.selected_channels))
+        if not self.plot_gate.should_update(request, plot_key):
+            return gr.skip()
+
+        # Serialize the figure only once per data change and share it between all sessions
+        if plot_key == self._plot_key:
+            return self._plot_data
+
+        window_size = self.get_window_size()
+        head = self.analyzer.get_history_snapshot()
+        history = self.analyzer.get_history(window_size, head)
+
+        fig = self._fig
+        downsample = len(history['timestamps']) > 2 * self.target_plot_points
+        for trace in fig['data']:
+            y = history[trace['meta']]
+            if downsample:
+                # Long windows hold far more samples than the plot has pixels, only send their visual outline
+                x, y = lttb_downsample(y, self.target_plot_points)
+                trace['x'] = typed_array(x, 'i4')
+            else:
+                # Without x, Plotly numbers the samples itself
+                trace['x'] = None
+            trace['y'] = typed_array(y, 'f4')
+        plot_data = PlotData(type="plotly", plot=pio.to_json(fig, validate=False))
+        # The history is read without a lock, drop the plot if the analyzer overwrote it meanwhile and redraw next tick
+        if self.analyzer.history_changed_since(head, window_size):
+            return gr.skip()
+        self._plot_data = plot_data
+        self._plot_key = plot_key
         
-        return fig
+        return self._plot_data
     
+    def _rebuild_plot_skeleton(self):
+        """Build the figure with one trace per selected channel and the threshold lines of the current profile.
+        This only runs when the channels, the profile or the history window change, `create_plots` just fills in the data.
+        The figure is made of plain dicts, which skips the (slow) validation of the graph objects."""
+        traces = []
+        hlines = []
+        for choice, field_name, threshold_name, color in self._selected_fields:
+            traces.append(dict(type="scattergl", x=[], y=[], name=choice, meta=field_name, line=dict(color=color)))
+            threshold = self._profile_thresholds.get(threshold_name)
+            if threshold is not None:
+                hlines.append(dict(type="line", xref="x domain", x0=0, x1=1, yref="y", y0=threshold, y1=threshold,
+                                   line=dict(color=color, dash="dash")))
+
+        self._fig = dict(
+            data=traces,
+            layout=dict(
+                template=self._plot_template,
+                shapes=hlines,
+                title=dict(text=f"Relative HSV Changes (Last {self.history_window} seconds)"),
+                xaxis=dict(title=dict(text="Samples")),
+                yaxis=dict(title=dict(text="Value")),
+                legend=dict(yanchor="bottom", orientation="h", y=1)
+            )
+        )
+        self._plot_key = None
+
     def export_csv(self):
-        """Open a file dialog and export to a user-defined CSV file."""
-        with self.lock:
-            history = self.analyzer.get_history()
+        """Export the history window to a CSV file in the temp directory and offer it as a browser download."""
+        window_size = self.get_window_size()
+        # The history is read without a lock, copy it again if the analyzer overwrote it meanwhile
+        for _ in range(3):
+            head = self.analyzer.get_history_snapshot()
+            history = self.analyzer.get_history(window_size, head)
+            # Stack all channels into one buffer, so pandas gets a single float block instead of one column each
+            values = np.column_stack([history[name] for name in CSV_COLUMNS])
+            timestamps = format_time_of_day(history['timestamps'])
+            if not self.analyzer.history_changed_since(head, window_size):
+                break
+        else:
+            self.logger.warning("The history kept changing while it was copied, the CSV export was cancelled.")
+            gr.Warning("Couldn't read a consistent history, please try again", 4)
+            return gr.update(visible=False)
             
-        if len(history) == 0:
+        if len(values) == 0:
             gr.Warning("No data to export", 4)
-            return
-        samples_per_second = 10
-        window_size = int(self.history_window * samples_per_second)
-        
-        def get_recent(data):
-            return data[-window_size:] if len(data) > window_size else data
+            return gr.update(visible=False)
         
-            # Get recent data
-        timestamps = get_recent(history['timestamps'])
-        h_means = get_recent(history['h_means'])
-        s_means = get_recent(history['s_means'])
-        v_means = get_recent(history['v_means'])
-        h_decay = get_recent(history['h_decay'])
-        s_decay = get_recent(history['s_decay'])
-        v_decay = get_recent(history['v_decay'])
-        d_h = get_recent(history['dH'])
-        d_s = get_recent(history['dS'])
-        d_v = get_recent(history['dV'])
-        dd_h = get_recent(history['ddH'])
-        dd_s = get_recent(history['ddS'])
-        dd_v = get_recent(history['ddV'])
+        data = pd.DataFrame(values, columns=list(CSV_COLUMNS.values()))
+        data.insert(0, 'Timestamp', timestamps)
 
         try:
-            
-            # Create root window and hide it
-            root = tk.Tk()
-            root.withdraw()
-            
-            # Open file dialog
-            file_path = filedialog.asksaveasfilename(
-                defaultextension='.csv',
-                filetypes=[('CSV files', '*.csv')],
-                title='Export HSV Data'
-            )
-            
-            if file_path:
-                with open(file_path, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    # Write header
-                    writer.writerow(['Timestamp', 
-                                'H_Measured', 'S_Measured', 'V_Measured',
-                                'H_Averaged', 'S_Averaged', 'V_Averaged',
-                                "dH", "dS", "dV",
-                                "ddH", "ddS", "ddV"])
-                    
-                    # Write data rows
-                    for i in range(len(h_means)):
-                        writer.writerow([timestamps[i],
-                                    h_means[i], s_means[i], v_means[i],
-                                    h_decay[i], s_decay[i], v_decay[i],
-                                    d_h[i], d_s[i], d_v[i],
-                                    dd_h[i], dd_s[i], dd_v[i]])  
-                        
-                gr.Info(f"Exported CSV to {file_path}", 4)
+            file_name = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            file_path = Path(tempfile.gettempdir()) / f"hsv_{file_name}.csv"
+            data.to_csv(file_path, index=False, float_format='%.6g')
+            gr.Info("Exported CSV, use the link below to download it", 4)
+            return gr.update(value=str(file_path), visible=True)
                 
-        except Exception as e:
-            print(f"Error exporting CSV: {str(e)}")
+        except Exception:
+            self.logger.exception("Error exporting CSV")
             gr.Warning("Error exporting CSV", 4)
+            return gr.update(visible=False)
         
-    def show_frame(self):
+    def show_frame(self, request: gr.Request = None):
         """Get the current frame, draw the ellipses from the analyzer over it and place the ellipse score text over the frame."""
-        frame = self.camera.get_frame()
+        # The camera frame is shared with the other consumers without copying, so we never draw on it directly
+        frame_id, frame = self.camera.get_frame_view()
+        # Take one consistent snapshot of the overlay, the analyzer thread may update it any time
+        ellipse, inner_ellipse, score_text = self.analyzer.current_ellipse, self.analyzer.inner_ellipse, self.analyzer.score_text
+        render_key = (frame_id, ellipse, inner_ellipse, score_text)
+        if not self.frame_gate.should_update(request, render_key):
+            return gr.skip()
+
         if frame is not None:
-            if self.analyzer.current_ellipse is not None:
+            # Another session already got this exact image
+            if render_key == self._last_render_key:
+                return self._last_frame_path
+
+            if ellipse is not None:
+                if self._annot_buf is None or self._annot_buf.shape != frame.shape:
+                    self._annot_buf = np.empty_like(frame)
+                np.copyto(self._annot_buf, frame)
+                frame = self._annot_buf
                 # Draw the ellipse on the frame
-                cv2.ellipse(frame, self.analyzer.current_ellipse, (0, 255, 0), 2)
-                cv2.ellipse(frame, self.analyzer.inner_ellipse, (50, 255, 50), 1)
-                # Add the score to the frame
-                try:
-                    text = f"Ellipse Score: {self.analyzer.ellipse_score:.2f}"
-                except:
-                    self.logger.info(f"Found illegal score: {self.analyzer.ellipse_score}")
-                cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (36, 255, 12), 2)
-
-            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                cv2.ellipse(frame, ellipse, (0, 255, 0), 2)
+                cv2.ellipse(frame, inner_ellipse, (50, 255, 50), 1)
+                # Add the score to the frame, the analyzer only provides a label for valid scores
+                if score_text is not None:
+                    cv2.putText(frame, score_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (36, 255, 12), 2)
+
+            # Encode the BGR frame with OpenCV, which skips the RGB conversion and is faster than Gradio's PIL encoder.
+            # Files inside the Gradio cache are served as they are.
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                return gr.skip()
+            self._last_frame_path = save_bytes_to_cache(jpeg.tobytes(), "frame.jpg", get_upload_folder())
+            self._last_render_key = render_key
+            return self._last_frame_path
         else:
             return None
         
@@ -267,18 +417,8 @@ class WebServer:
             return "Load Video"
         
         try:
-            # Create root window and hide it
-            root = tk.Tk()
-            root.withdraw()
-            
-            # Open file dialog
-            file_path = filedialog.askopenfilename(
-                defaultextension='.mp4',
-                filetypes=[('Video files', '*.mp4 *.avi *.mkv *.mov')],
-                title='Load video file for analysis'
-            )
-
-            root.destroy()
+            # Open file dialog on the dialog thread that owns the Tk root
+            file_path = self._dialog_executor.submit(self._ask_video_path).result()
             
             if file_path:
                 self.logger.info(f" Got video file path {file_path}")
@@ -304,11 +444,57 @@ class WebServer:
             self.logger.error(f"Error loading video file: {str(e)}")
             gr.Warning("Error loading video file!", 3)
             
+    def _get_tk_root(self) -> "tk.Tk":
+        """Return the hidden Tk root that parents all file dialogs, it is created on first use.
+        Runs on the dialog thread, as Tk may only be used from the thread that created it.
+        Returns None if Tk can't be initialized, e.g. without a display."""
+        if self._tk_root is None:
+            # Imported here, so servers that never open a dialog don't load Tk at all
+            import tkinter as tk
+            try:
+                self._tk_root = tk.Tk()
+                self._tk_root.withdraw()
+            except tk.TclError as e:
+                self.logger.warning(f" Failed to initialize tkinter, file dialogs aren't available: {str(e)}")
+        return self._tk_root
+
+    def _destroy_tk_root(self):
+        """Free the Tk root, runs on the dialog thread"""
+        if self._tk_root is not None:
+            self._tk_root.destroy()
+            self._tk_root = None
+
+    def _ask_video_path(self) -> str:
+        """Show the dialog for picking a video file, runs on the dialog thread"""
+        from tkinter import filedialog
+        root = self._get_tk_root()
+        if root is None:
+            return ""
+        file_path = filedialog.askopenfilename(
+            parent=root,
+            defaultextension='.mp4',
+            filetypes=[('Video files', '*.mp4 *.avi *.mkv *.mov')],
+            title='Load video file for analysis'
+        )
+        # Process the pending events so the closed dialog disappears
+        root.update()
+        return file_path
+
     def shutdown(self):
-        self.should_stop = True
+        """Signal the workers to stop and close the server, which returns from `launch` in the main thread"""
+        self.stop_event.set()
+        with self._camera_settings_lock:
+            if self._camera_settings_timer is not None:
+                self._camera_settings_timer.cancel()
+                self._camera_settings_timer = None
+        # Finalize the MP4 file, the capture thread stops writing once the flag is cleared
+        if self.camera.is_recording:
+            self.camera.stop_recording()
+        try:
+            self._dialog_executor.submit(self._destroy_tk_root).result(timeout=1)
+        except Exception:
+            self.logger.warning("Failed to clean up the tkinter root, a file dialog might still be open.")
         gr.close_all(True)
-        time.sleep(0.5) # time for threads to clean up
-        os._exit(0)
             
     def launch(self):
         """Launch the main webserver, construct the UI and connect methods to the buttons."""
@@ -320,12 +506,11 @@ class WebServer:
         self.set_new_reference()
 
         # Load threshold profiles from file and activate the first one
-        profile_manager = ProfileManager()
         current_file_dir = Path(__file__).parent
         profile_path = current_file_dir / "../profiles.csv"
         if profile_path.exists():
-            profile_manager.load_profiles(profile_path)
-            self.analyzer.set_profile(profile_manager.profiles[profile_manager.get_profile_names()[0]])
+            self.profile_manager.load_profiles(profile_path)
+            self.set_profile(self.profile_manager.profiles[self.profile_manager.get_profile_names()[0]])
         else:
             self.logger.warning(" No profiles.csv found.")
         
@@ -333,7 +518,7 @@ class WebServer:
             with gr.Row():
                 gr.Plot(self.create_plots, every=0.1, scale=2, show_label=False)
                 with gr.Column():
-                    frame = gr.Image(self.show_frame, every=0.03, scale=1, show_label=False)
+                    frame = gr.Image(self.show_frame, every=0.03, scale=1, show_label=False, type="filepath")
                     with gr.Row():
                         record_btn = gr.Button("Record")
                         load_video_btn = gr.Button("Load Video")
@@ -345,6 +530,7 @@ class WebServer:
                 log_btn = gr.Button("Log timestamp")
                 export_btn = gr.Button("Export CSV")
                 close_btn = gr.Button("Close")
+            csv_file = gr.File(label="Exported CSV", visible=False)
             with gr.Row():
                 toggle_ellipse = gr.Checkbox(True, label="Enable ellipsoid masking")
                 toggle_ellipse.change(fn=self.analyzer.set_ellipse_masking, inputs=[toggle_ellipse])
@@ -360,13 +546,18 @@ class WebServer:
             with gr.Row():
                 camera_select = gr.Dropdown(
                     choices=self.camera_names,
-                    value=self.camera_names[0] if self.camera_names else None,
+                    value=initial_camera or None,
                     label="Select Camera"
                 )
                 
                 history_size = gr.Number(60, label="History in seconds", precision=0, minimum=0, maximum=1800)
                 history_size.change(fn=self.update_history_window, inputs=[history_size])
 
+                plot_rate = gr.Slider(0.5, 10, value=1, step=0.5, label="Plot Hz")
+                frame_rate = gr.Slider(1, 30, value=10, step=1, label="Video Hz")
+                plot_rate.change(fn=self.set_refresh_rates, inputs=[plot_rate, frame_rate])
+                frame_rate.change(fn=self.set_refresh_rates, inputs=[plot_rate, frame_rate])
+
                 ellipse_smoothing_alpha = gr.Number(
                     value=0.6,
                     label="Ellipse Smoothing",
@@ -418,12 +609,11 @@ class WebServer:
             with gr.Row():
 
                 channel_dropdown = gr.Dropdown(
-                    ["H (raw)", "S (raw)", "V (raw)", "H (smooth)", "S (smooth)", "V (smooth)",
-                     "dH", "dS", "dV", "ddH", "ddS", "ddV"],
+                    list(CHANNEL_SPEC),
                     label="Channels", scale=1, show_label=True, multiselect=True, value=self.selected_channels)
                 
                 def update_selected_channels(selected):
-                    self.selected_channels = selected
+                    self.set_selected_channels(selected)
 
                 channel_dropdown.change(
                     fn=update_selected_channels,
@@ -431,16 +621,16 @@ class WebServer:
                 )
 
                 profile_dropdown = gr.Dropdown(
-                    choices=profile_manager.get_profile_names(),
+                    choices=self.profile_manager.get_profile_names(),
                     label="Select Profile",
                     multiselect=False,
                     show_label=True
                 )
 
                 def on_profile_selected(profile_name):
-                    profile = profile_manager.get_profile(profile_name)
+                    profile = self.profile_manager.get_profile(profile_name)
                     gr.Info(f"Selected profile: {profile_name}", 2)
-                    self.analyzer.set_profile(profile)
+                    self.set_profile(profile)
 
                 profile_dropdown.change(
                     fn=on_profile_selected,
@@ -469,11 +659,10 @@ class WebServer:
                     return 1.0
                 
                 # Use a one-time event to update the exposure display
-                exposure_init = gr.Button(visible=False, elem_id="exposure_init")
                 demo.load(fn=get_initial_exposure, outputs=[exposure])
 
                 exposure.change(
-                    fn = lambda x: self.camera.__setattr__('exposure', x),
+                    fn = lambda x: self.update_camera_setting('exposure', x),
                     inputs=[exposure]
                 )
 
@@ -487,7 +676,7 @@ class WebServer:
                 )
 
                 gamma.change(
-                    fn = lambda x: self.camera.build_gamma_LUT(x),
+                    fn = lambda x: self.update_camera_setting('gamma', x),
                     inputs=[gamma]
                 )
 
@@ -501,7 +690,7 @@ class WebServer:
                 )
 
                 red_gain.change(
-                    fn = lambda x: self.camera.__setattr__('red_gain', x),
+                    fn = lambda x: self.update_camera_setting('red_gain', x),
                     inputs=[red_gain]
                 )
 
@@ -515,7 +704,7 @@ class WebServer:
                 )
 
                 blue_gain.change(
-                    fn = lambda x: self.camera.__setattr__('blue_gain', x),
+                    fn = lambda x: self.update_camera_setting('blue_gain', x),
                     inputs=[blue_gain]
                 )
 
@@ -543,7 +732,7 @@ class WebServer:
             load_video_btn.click(self.load_video, outputs=load_video_btn)
 
             ref_btn.click(self.set_new_reference)
-            export_btn.click(self.export_csv)
+            export_btn.click(self.export_csv, outputs=[csv_file])
             log_btn.click(self.analyzer.log_timestamp)
             close_btn.click(self.shutdown)
 
@@ -553,5 +742,4 @@ class WebServer:
             self.alert_timer.tick(fn=self.check_alerts)
             
        
-        # self.should_stop = True
         demo.queue().launch(theme=gr.themes.Soft(), server_name='0.0.0.0', footer_links=[""])
\ No newline at end of file